@@ -1,14 +1,29 @@
+import sys
+import re
 import time
 import os
+import errno
+import shutil
+import atexit
 import logging
+import hashlib
+import functools
 
 import subprocess
+import threading
+import queue
 import concurrent.futures
-from multiprocessing import Manager, freeze_support
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 import json  # Added import for json module
 
+# Optional: PyAV reads container metadata in-process, saving a fork+exec
+# of ffprobe per verification. The daemon works fine without it.
+try:
+    import av
+except ImportError:
+    av = None
+
 # Env variables
 ENABLE_HW_ACCEL = os.getenv('ENABLE_HW_ACCEL', 'true').lower() == 'true'
 HW_ENCODING_TYPE = os.getenv('HW_ENCODING_TYPE', 'nvidia').lower()  # nvidia, intel
@@ -28,7 +43,34 @@ SYMLINK_VERSION_SUFFIX = os.getenv('SYMLINK_VERSION_SUFFIX', ' - 720p')  # Versi
 # Quality suffixes to detect and replace in filenames (for same-folder multi-version)
 QUALITY_SUFFIXES = [' - 4K', ' - 2160p', ' - 1080p', ' - 720p', ' - 480p', ' - SD', ' - HDR', ' - REMUX', ' - Remux']
 
-import re
+# Precompiled: matches any quality suffix at the end of a name in one pass
+_QUALITY_SUFFIX_RE = re.compile('(?:' + '|'.join(map(re.escape, QUALITY_SUFFIXES)) + ')$')
+_VERSION_SUFFIX_STRIPPED = SYMLINK_VERSION_SUFFIX.strip()
+_VERSION_MKV_SUFFIX = f'{SYMLINK_VERSION_SUFFIX}.mkv'
+
+# True when encoded versions live next to the originals (same-folder
+# multi-version mode); computed once instead of per call
+_SAME_FOLDER_MODE = os.path.normpath(SOURCE_FOLDER) == os.path.normpath(DEST_FOLDER)
+
+# Filename quality markers, compiled once instead of two substring loops
+# per file ('sd' is word-bounded so it doesn't match inside other words)
+_LOW_QUALITY_RE = re.compile(r'720p|480p|360p|\bsd\b|dvdrip|hdtv|webrip', re.IGNORECASE)
+_HIGH_QUALITY_RE = re.compile(r'1080p|2160p|4k|uhd|bluray|bdremux|remux', re.IGNORECASE)
+
+# Skip the ffprobe fallback for files whose name carries no quality hint
+# (saves thousands of probe spawns on a first library scan)
+SKIP_AMBIGUOUS_PROBE = os.getenv('SKIP_AMBIGUOUS_PROBE', 'false').lower() == 'true'
+
+# Re-probe freshly encoded output before renaming it into place. Off by
+# default: ffmpeg exiting 0 already implies a fully muxed container.
+VERIFY_OUTPUT = os.getenv('VERIFY_OUTPUT', 'false').lower() == 'true'
+
+# Order for the initial scan queue: 'sjf' encodes the smallest files
+# first (results appear quickly), 'lpt' starts the longest jobs first
+# (best overall makespan), 'fifo' keeps walk order
+SCHED_ORDER = os.getenv('SCHED_ORDER', 'sjf').lower()
+
+
 def get_version_output_name(source_name):
     """
     Generate output filename for multi-version support.
@@ -37,24 +79,135 @@ def get_version_output_name(source_name):
     """
     if not SYMLINK_VERSION_SUFFIX:
         return source_name
-    
+
     # Check if source already has our version suffix (skip)
-    if source_name.endswith(SYMLINK_VERSION_SUFFIX.strip()):
+    if source_name.endswith(_VERSION_SUFFIX_STRIPPED):
         return None  # Skip - this is already a transcoded version
-    
-    # Try to replace existing quality suffix
-    for suffix in QUALITY_SUFFIXES:
-        if source_name.endswith(suffix):
-            return source_name[:-len(suffix)] + SYMLINK_VERSION_SUFFIX
-    
-    # No quality suffix found - append version suffix
+
+    # Replace an existing quality suffix, else append the version suffix
+    new_name, replaced = _QUALITY_SUFFIX_RE.subn(SYMLINK_VERSION_SUFFIX, source_name)
+    if replaced:
+        return new_name
     return source_name + SYMLINK_VERSION_SUFFIX
 
 TIMEOUT = 86400
 MAX_SAME_SIZE_COUNT = 60
 
+# Worker pool size: hardware encoders support a couple of concurrent
+# sessions; software encoding fans out across cores
+if ENABLE_HW_ACCEL:
+    _default_sessions = 2 if HW_ENCODING_TYPE == 'nvidia' else 1
+    MAX_WORKERS = int(os.getenv('HW_SESSIONS', str(_default_sessions)))
+else:
+    # libx265/libsvtav1 scale well up to ~4 threads per encode; one job
+    # per core at full thread count just thrashes caches and context
+    # switches, so give each job >=4 threads instead
+    MAX_WORKERS = max(1, (os.cpu_count() or 1) // 4)
+
+# Cap per-process ffmpeg threading so N concurrent software encodes do
+# not oversubscribe the CPU (each ffmpeg defaults to using all cores)
+try:
+    FFMPEG_THREADS = int(os.getenv('FFMPEG_THREADS', '0'))
+except ValueError:
+    FFMPEG_THREADS = 0
+if FFMPEG_THREADS <= 0:
+    FFMPEG_THREADS = max(1, (os.cpu_count() or 1) // MAX_WORKERS)
+FFMPEG_THREADS = min(FFMPEG_THREADS, 64)
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Constant-quality targets per preset; cq drives the hardware encoders,
+# crf the software fallback
+QUALITY_SETTINGS = {
+    'LOW': {'cq': {'av1': 45, 'hevc': 32}, 'crf': {'av1': 40, 'hevc': 30}},
+    'MEDIUM': {'cq': {'av1': 35, 'hevc': 26}, 'crf': {'av1': 35, 'hevc': 26}},
+    'HIGH': {'cq': {'av1': 28, 'hevc': 22}, 'crf': {'av1': 28, 'hevc': 22}},
+}
+
+_quality = QUALITY_SETTINGS.get(ENCODING_QUALITY, QUALITY_SETTINGS['LOW'])
+
+# Rough bitrate (video+audio) our 720p output lands at per codec and
+# quality preset; used to spot sources that are already smaller than
+# the encode would produce
+_EXPECTED_BPS = {
+    'hevc': {'LOW': 1_800_000, 'MEDIUM': 2_800_000, 'HIGH': 4_200_000},
+    'av1': {'LOW': 1_400_000, 'MEDIUM': 2_200_000, 'HIGH': 3_400_000},
+}
+_bps_by_quality = _EXPECTED_BPS.get(ENCODING_CODEC, _EXPECTED_BPS['hevc'])
+EXPECTED_BPS = _bps_by_quality.get(ENCODING_QUALITY, _bps_by_quality['LOW'])
+
+# Video-encoder argument lists per (backend, codec); the configured
+# combination is resolved once at startup instead of re-branching (and
+# re-warning) on every file
+_ENCODER_ARGS = {
+    # NVENC runs on a dedicated block, so the quality knobs (hq tune,
+    # adaptive quantization, lookahead, B-ref) are close to free in fps
+    # and buy bitrate at the same CQ
+    ('nvidia', 'av1'): ['-c:v', 'av1_nvenc', '-preset', 'p6', '-tune', 'hq',
+                        '-cq', str(_quality['cq']['av1']),
+                        '-temporal-aq', '1', '-rc-lookahead', '32'],
+    ('nvidia', 'hevc'): ['-c:v', 'hevc_nvenc', '-preset', 'p6', '-tune', 'hq',
+                         '-rc', 'vbr', '-cq', str(_quality['cq']['hevc']), '-b:v', '0',
+                         '-temporal-aq', '1', '-spatial-aq', '1',
+                         '-rc-lookahead', '32', '-b_ref_mode', 'middle'],
+    ('intel', 'av1'): ['-c:v', 'av1_qsv', '-preset', 'medium',
+                       '-global_quality', str(_quality['cq']['av1'])],
+    ('intel', 'hevc'): ['-c:v', 'hevc_qsv', '-preset', 'medium',
+                        '-global_quality', str(_quality['cq']['hevc'])],
+    # Software fallback - cap threads per job so parallel encodes share
+    # the cores instead of thrashing each other
+    ('sw', 'av1'): ['-c:v', 'libsvtav1', '-preset', '6',
+                    '-crf', str(_quality['crf']['av1']), '-cpu-used', '4',
+                    '-threads', str(FFMPEG_THREADS),
+                    '-svtav1-params', f'lp={FFMPEG_THREADS}:tile-columns=2:tile-rows=1'],
+    ('sw', 'hevc'): ['-c:v', 'libx265', '-preset', 'medium',
+                     '-crf', str(_quality['crf']['hevc']),
+                     '-threads', str(FFMPEG_THREADS),
+                     '-x265-params', f'pools={FFMPEG_THREADS}'],
+}
+
+
+def _resolve_video_encoder():
+    """Validate the encoding env vars once and pick the backend + args."""
+    codec = ENCODING_CODEC
+    if codec not in ('av1', 'hevc'):
+        logging.warning(f'Unsupported codec "{ENCODING_CODEC}". Defaulting to HEVC.')
+        codec = 'hevc'
+    if ENABLE_HW_ACCEL:
+        if HW_ENCODING_TYPE in ('nvidia', 'intel'):
+            return HW_ENCODING_TYPE, _ENCODER_ARGS[(HW_ENCODING_TYPE, codec)]
+        logging.error(f'Unsupported hardware acceleration "{HW_ENCODING_TYPE}". '
+                      'Falling back to software encoding.')
+    return 'sw', _ENCODER_ARGS[('sw', codec)]
+
+
+VIDEO_ENCODER_BACKEND, VIDEO_ENCODER_ARGS = _resolve_video_encoder()
+
+# Full-GPU pipeline for the hardware backends: decoding and scaling
+# stay in device memory (NVDEC+scale_cuda, or the QSV equivalents),
+# skipping the host<->device copy of every frame that a CPU decode
+# would pay. encode_video retries with CPU decode and scale when the
+# hardware decoder rejects the input codec.
+if VIDEO_ENCODER_BACKEND == 'nvidia':
+    HWACCEL_INPUT_ARGS = ['-hwaccel', 'cuda', '-hwaccel_output_format', 'cuda']
+    HW_SCALE_FILTER = 'scale_cuda=-1:720'
+elif VIDEO_ENCODER_BACKEND == 'intel':
+    HWACCEL_INPUT_ARGS = ['-hwaccel', 'qsv', '-hwaccel_output_format', 'qsv']
+    HW_SCALE_FILTER = 'scale_qsv=-1:720'
+else:
+    HWACCEL_INPUT_ARGS = []
+    HW_SCALE_FILTER = 'scale=-1:720'
+
+
+# Watchdog only emits file-close events on inotify (Linux); elsewhere we
+# keep the original size-polling loop as fallback
+_CLOSE_EVENTS_SUPPORTED = sys.platform.startswith('linux')
+
+# Files seen by the watcher mapped to an Event that is set the moment the
+# writer closes them (inotify IN_CLOSE_WRITE via watchdog's on_closed)
+_close_events = {}
+_close_events_lock = threading.Lock()
+
 
 class VideoHandler(FileSystemEventHandler):
     def on_created(self, event):
@@ -62,71 +215,208 @@ class VideoHandler(FileSystemEventHandler):
             return
         if is_video_file(event.src_path):
             logging.info(f'New video file detected: {event.src_path}')
+            if _CLOSE_EVENTS_SUPPORTED:
+                with _close_events_lock:
+                    _close_events.setdefault(event.src_path, threading.Event())
             submit_encoding_task(event.src_path)
 
+    def on_closed(self, event):
+        if event.is_directory:
+            return
+        with _close_events_lock:
+            close_event = _close_events.get(event.src_path)
+        if close_event is not None:
+            close_event.set()
+
+    def on_moved(self, event):
+        if event.is_directory:
+            return
+        if is_video_file(event.dest_path):
+            logging.info(f'Video file moved: {event.src_path} -> {event.dest_path}')
+            # A rename doesn't rewrite the data, so the file under its
+            # new name is already complete: register a pre-set close
+            # event so the worker doesn't sit in the stable-size poll
+            if _CLOSE_EVENTS_SUPPORTED:
+                done = threading.Event()
+                done.set()
+                with _close_events_lock:
+                    _close_events.pop(event.src_path, None)
+                    _close_events[event.dest_path] = done
+            # Don't delete the old name's encode here - encode_video
+            # reclaims it through the content index and just renames it
+            submit_encoding_task(event.dest_path)
+        elif is_video_file(event.src_path):
+            # Renamed to a non-video name: the source is effectively gone
+            logging.info(f'Video file moved away: {event.src_path}')
+            with _close_events_lock:
+                close_event = _close_events.pop(event.src_path, None)
+            if close_event is not None:
+                close_event.set()
+            delete_encoded_video(event.src_path)
+
     def on_deleted(self, event):
         if event.is_directory:
             return
         if is_video_file(event.src_path):
             logging.info(f'Video file deleted: {event.src_path}')
+            # Wake any waiter so it notices the file is gone
+            with _close_events_lock:
+                close_event = _close_events.pop(event.src_path, None)
+            if close_event is not None:
+                close_event.set()
             delete_encoded_video(event.src_path)
 
 
-def get_video_resolution_from_ffprobe(filepath):
-    """Get video resolution (height) using ffprobe."""
+# Bounds concurrent ffprobe spawns: encoder slots are limited by the
+# worker count, but probe bursts (library scans) get their own cap so
+# they don't fork-storm the box while encodes are running
+_probe_semaphore = threading.BoundedSemaphore(max(2, (os.cpu_count() or 1) // 2))
+
+class _DiskCache:
+    """
+    JSON-backed cache of per-file results that survives restarts.
+
+    Entries map path -> [size, mtime_ns, value]; a stat mismatch means
+    the file changed and the entry is treated as missing. Saved via an
+    atomic tmp-file rename, like the symlink index.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._dirty = False
+        try:
+            with open(path) as f:
+                self._data = json.load(f)
+        except (OSError, ValueError):
+            self._data = {}
+
+    def get(self, key, st):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+                return entry[2]
+        return None
+
+    def put(self, key, st, value):
+        with self._lock:
+            self._data[key] = [st.st_size, st.st_mtime_ns, value]
+            self._dirty = True
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            snapshot = dict(self._data)
+            self._dirty = False
+        try:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(snapshot, f)
+            os.rename(tmp_path, self.path)
+        except OSError as e:
+            logging.error(f'Failed to write cache {self.path}: {e}')
+
+
+# Probe results persisted across restarts so a rescan of an unchanged
+# library spawns zero ffprobe processes, plus the set of outputs that
+# already passed verification so restarts skip re-verifying them
+_probe_cache = _DiskCache(os.path.join(DEST_FOLDER, '.probe_cache.json'))
+_verify_cache = _DiskCache(os.path.join(DEST_FOLDER, '.verify_cache.json'))
+
+
+def _save_caches():
+    _probe_cache.save()
+    _verify_cache.save()
+
+
+atexit.register(_save_caches)
+
+
+@functools.lru_cache(maxsize=1024)
+def _probe(filepath, size, mtime):
+    """
+    Run a single ffprobe call covering streams and format tags.
+
+    Cached by (path, size, mtime) so repeated checks on the same unchanged
+    file (resolution, metadata, audio, subtitles) cost one subprocess total.
+    """
     try:
-        cmd = ['ffprobe', '-v', 'error', '-select_streams', 'v:0',
-               '-show_entries', 'stream=height', '-of', 'csv=p=0', filepath]
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+        cmd = ['ffprobe', '-v', 'error',
+               # Bound how much of the file ffprobe reads: metadata lives at
+               # the head, so the first second is enough and keeps probes
+               # cheap on large MKVs over NFS mounts
+               '-analyzeduration', '1M', '-probesize', '5M',
+               '-read_intervals', '%+#1',
+               '-show_entries', 'stream=index,codec_type,codec_name,height,channels',
+               '-show_entries', 'format=duration:format_tags=title,date,year,creation_time',
+               '-of', 'json', filepath]
+        with _probe_semaphore:
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
         if result.returncode == 0 and result.stdout.strip():
-            height = int(result.stdout.strip().split('\n')[0])
-            return height
+            return json.loads(result.stdout)
+        logging.error(f'ffprobe failed for file: {filepath}')
     except Exception as e:
-        logging.debug(f'ffprobe resolution check failed for {filepath}: {e}')
+        logging.debug(f'ffprobe failed for {filepath}: {e}')
+    return {}
+
+
+def probe_file(filepath):
+    """Return cached ffprobe info for filepath (empty dict on failure)."""
+    try:
+        st = os.stat(filepath)
+    except OSError:
+        return {}
+
+    # On-disk cache first: survives restarts, unlike the lru_cache
+    cached = _probe_cache.get(filepath, st)
+    if cached is not None:
+        return cached
+
+    probe_data = _probe(filepath, st.st_size, st.st_mtime)
+    if probe_data:
+        _probe_cache.put(filepath, st, probe_data)
+    return probe_data
+
+
+def get_video_resolution_from_ffprobe(filepath, probe_data=None):
+    """Get video resolution (height) from the cached ffprobe info."""
+    if probe_data is None:
+        probe_data = probe_file(filepath)
+    for stream in probe_data.get('streams', []):
+        if stream.get('codec_type') == 'video' and stream.get('height'):
+            return int(stream['height'])
     return None
 
 
-def get_metadata_info(filepath):
+def get_metadata_info(filepath, probe_data=None):
     """Extract metadata from video file (year, title, etc.)."""
-    try:
-        cmd = ['ffprobe', '-v', 'error', '-show_entries',
-               'format_tags=title,date,year,creation_time',
-               '-of', 'json', filepath]
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-        if result.returncode == 0:
-            data = json.loads(result.stdout)
-            tags = data.get('format', {}).get('tags', {})
-            return tags
-    except Exception as e:
-        logging.debug(f'Metadata extraction failed for {filepath}: {e}')
-    return {}
+    if probe_data is None:
+        probe_data = probe_file(filepath)
+    return probe_data.get('format', {}).get('tags', {})
 
 
-def is_already_low_quality(filepath):
+def is_already_low_quality(filepath, probe_data=None):
     """
     Check if file is already 720p or lower quality (no need to transcode).
-    
+
     First checks filename patterns, then falls back to ffprobe for actual resolution.
     """
     filename = os.path.basename(filepath)
-    name_lower = filename.lower()
-    
-    # Skip files that are already 720p or lower
-    low_quality_markers = ['720p', '480p', '360p', 'sd', 'dvdrip', 'hdtv', 'webrip']
-    # But don't skip if they're higher quality
-    high_quality_markers = ['1080p', '2160p', '4k', 'uhd', 'bluray', 'bdremux', 'remux']
-    
-    has_low = any(marker in name_lower for marker in low_quality_markers)
-    has_high = any(marker in name_lower for marker in high_quality_markers)
-    
+
     # If filename clearly indicates quality, use that
-    if has_high:
+    if _HIGH_QUALITY_RE.search(filename):
         return False  # High quality - needs transcoding
-    if has_low:
+    if _LOW_QUALITY_RE.search(filename):
         return True   # Low quality - skip
-    
+
+    if SKIP_AMBIGUOUS_PROBE:
+        # Ambiguous filename and probing disabled - most unmarked files
+        # are 1080p+, so assume it needs transcoding
+        return False
+
     # Filename doesn't indicate quality - use ffprobe
-    height = get_video_resolution_from_ffprobe(filepath)
+    height = get_video_resolution_from_ffprobe(filepath, probe_data)
     if height is not None:
         logging.info(f'Detected resolution via ffprobe: {height}p for {filename}')
         if height <= 720:
@@ -139,13 +429,16 @@ def is_already_low_quality(filepath):
     logging.info(f'Could not determine resolution for {filename}, will transcode')
     return False
 
+VIDEO_EXTENSIONS = frozenset({'.mp4', '.mkv', '.avi', '.mov', '.wmv',
+                              '.flv', '.mpeg', '.mpg', '.webm'})
+
+
 def is_video_file(filename):
-    vid_ext = ('.mp4', '.mkv', '.avi', '.mov', '.wmv', '.flv', '.mpeg', '.mpg', '.webm')
-    if not filename.lower().endswith(vid_ext):
-        return False
-    
     base_name = os.path.basename(filename)
-    
+    dot = base_name.rfind('.')
+    if dot == -1 or base_name[dot:].lower() not in VIDEO_EXTENSIONS:
+        return False
+
     # Skip macOS resource fork files (._filename) and other system/temp files
     # These are metadata files that look like videos but contain no actual video data
     if base_name.startswith('._'):
@@ -156,12 +449,12 @@ def is_video_file(filename):
         return False  # Skip temporary/partial files
     
     # Skip version files (created by this script - either symlinks or actual transcoded files)
-    if SYMLINK_VERSION_SUFFIX and filename.endswith(f'{SYMLINK_VERSION_SUFFIX}.mkv'):
+    if SYMLINK_VERSION_SUFFIX and filename.endswith(_VERSION_MKV_SUFFIX):
         return False
     # Also skip files that have our version suffix anywhere (handles case variations)
-    if SYMLINK_VERSION_SUFFIX and SYMLINK_VERSION_SUFFIX.strip() in base_name:
+    if SYMLINK_VERSION_SUFFIX and _VERSION_SUFFIX_STRIPPED in base_name:
         name_without_ext = os.path.splitext(base_name)[0]
-        if name_without_ext.endswith(SYMLINK_VERSION_SUFFIX.strip()):
+        if name_without_ext.endswith(_VERSION_SUFFIX_STRIPPED):
             return False
     return True
 
@@ -170,38 +463,129 @@ def is_version_symlink(filepath):
     """Check if a file is a version symlink created by this script."""
     if not SYMLINK_VERSION_SUFFIX:
         return False
-    return os.path.basename(filepath).endswith(f'{SYMLINK_VERSION_SUFFIX}.mkv') and os.path.islink(filepath)
+    return os.path.basename(filepath).endswith(_VERSION_MKV_SUFFIX) and os.path.islink(filepath)
 
 
 def wait_for_file_completion(filepath, timeout=TIMEOUT):
-    last_size, same_size_count = -1, 0
-    start = time.time()
-    while True:
-        try:
-            curr_size = os.path.getsize(filepath)
+    # Event-driven wait: woken by on_closed the instant the writer closes
+    # the file, instead of polling for 60s of stable size. The entry is
+    # left in place so on_closed can still find it; encode_video removes
+    # it when it finishes with the path.
+    with _close_events_lock:
+        close_event = _close_events.get(filepath)
+    if close_event is not None:
+        if close_event.wait(timeout):
+            return os.path.exists(filepath)
+        logging.warning(f'Timeout waiting for: {filepath}')
+        return False
+
+    # Fallback polling loop (initial scan, non-inotify platforms).
+    # Hold one fd open and fstat it: cheaper than re-resolving the path
+    # every second, which matters on networked filesystems.
+    try:
+        fd = os.open(filepath, os.O_RDONLY)
+    except OSError:
+        logging.info(f'File removed: {filepath}')
+        return False
+    try:
+        last_size, same_size_count = -1, 0
+        start = time.time()
+        while True:
+            curr_size = os.fstat(fd).st_size
             same_size_count = same_size_count + 1 if curr_size == last_size else 0
             if same_size_count >= MAX_SAME_SIZE_COUNT:
-                return True
+                # fstat keeps working on a deleted file; confirm the path
+                # is still there before reporting completion
+                return os.path.exists(filepath)
             if time.time() - start > timeout:
                 logging.warning(f'Timeout waiting for: {filepath}')
                 return False
             last_size = curr_size
             time.sleep(1)
-        except FileNotFoundError:
-            logging.info(f'File removed: {filepath}')
-            return False
+    except OSError:
+        logging.info(f'File removed: {filepath}')
+        return False
+    finally:
+        os.close(fd)
+
+def _stat_or_none(path):
+    """Single stat standing in for repeated os.path.exists checks."""
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+
+def _fadvise(path, advice_name):
+    """Best-effort posix_fadvise by name; silently a no-op elsewhere."""
+    advice = getattr(os, advice_name, None)
+    if advice is None or not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, advice)
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
+
+
+def atomic_replace(src, dst):
+    """
+    Atomically move src over dst.
+
+    os.replace is atomic within a filesystem; if src and dst live on
+    different filesystems (EXDEV) fall back to copying next to dst and
+    replacing from there, so dst still only ever appears fully written.
+    """
+    try:
+        os.replace(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        transfer = dst + '.xfer'
+        shutil.copyfile(src, transfer)
+        os.replace(transfer, dst)
+        os.remove(src)
+
 
 def is_file_growing(file_path, check_interval=10):
-    size1 = os.path.getsize(file_path)
-    time.sleep(check_interval)
-    if not os.path.exists(file_path):
+    try:
+        fd = os.open(file_path, os.O_RDONLY)
+    except OSError:
         # File has been deleted in the meantime
         return False
-    size2 = os.path.getsize(file_path)
-    return size2 > size1
+    try:
+        size1 = os.fstat(fd).st_size
+        time.sleep(check_interval)
+        if not os.path.exists(file_path):
+            # File has been deleted in the meantime
+            return False
+        size2 = os.fstat(fd).st_size
+        return size2 > size1
+    finally:
+        os.close(fd)
 
 def verify_encoded_file(file_path):
-    cmd = ['ffprobe', '-v', 'error', '-select_streams', 'v', '-show_entries', 'format=duration',
+    if av is not None:
+        # In-process demux: no fork, no exec, just the MKV header read
+        try:
+            with av.open(file_path) as container:
+                return (container.duration or 0) > 0
+        except Exception as e:
+            logging.error(f'File verification error {file_path}: {e}')
+            return False
+
+    # Cap how much of the (potentially multi-GB) output ffprobe reads:
+    # the container duration lives in the header, so a bounded probe
+    # window and a single read interval are enough. Note this must stay
+    # format=duration - we mux matroska, which carries no per-stream
+    # duration field, so a stream-level query reports N/A
+    cmd = ['ffprobe', '-v', 'error',
+           '-analyzeduration', '1000000', '-probesize', '1000000',
+           '-read_intervals', '%+#1',
+           '-show_entries', 'format=duration',
            '-of', 'default=noprint_wrappers=1:nokey=1', file_path]
     try:
         output = subprocess.check_output(cmd, stderr=subprocess.STDOUT)
@@ -212,17 +596,18 @@ def verify_encoded_file(file_path):
         return False
 
 
-def get_audio_streams(source_path):
-    ffprobe_cmd = [
-        'ffprobe', '-v', 'error', '-select_streams', 'a',
-        '-show_entries', 'stream=index,codec_name', '-of', 'json', source_path
-    ]
-    ffprobe_process = subprocess.run(ffprobe_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    if ffprobe_process.returncode != 0:
-        logging.error(f'ffprobe failed for file: {source_path}')
-        return []
-    stream_info = json.loads(ffprobe_process.stdout)
-    return stream_info.get('streams', [])
+def verify_encoded_file_cached(file_path):
+    """verify_encoded_file with positive results persisted across restarts."""
+    st = _stat_or_none(file_path)
+    if st is None:
+        return False
+    if _verify_cache.get(file_path, st):
+        return True
+    ok = verify_encoded_file(file_path)
+    if ok:
+        _verify_cache.put(file_path, st, True)
+    return ok
+
 
 # Subtitle codec categories for MKV output
 # Copy-safe: can be directly copied to MKV container
@@ -231,219 +616,327 @@ SUBTITLE_CODECS_COPY = ['ass', 'ssa', 'srt', 'subrip', 'hdmv_pgs_subtitle', 'dvb
 SUBTITLE_CODECS_CONVERT = ['mov_text', 'webvtt']
 
 
-def get_subtitle_streams(source_path):
+def get_streams(source_path, probe_data=None):
     """
-    Analyze subtitle streams and categorize them for MKV output.
-    
-    Returns:
-        dict with 'copy' and 'convert' lists, each containing (stream_index, codec_name) tuples
+    Partition the probed streams into audio and subtitle groups.
+
+    Subtitles are further categorized for MKV output. Returns a dict with
+    'audio' (list of stream dicts) and 'subtitles' (dict with 'copy' and
+    'convert' lists of (stream_index, codec_name) tuples).
     """
-    ffprobe_cmd = [
-        'ffprobe', '-v', 'error', '-select_streams', 's',
-        '-show_entries', 'stream=index,codec_name', '-of', 'json', source_path
-    ]
-    ffprobe_process = subprocess.run(ffprobe_cmd, stdout=subprocess.PIPE,
-                                     stderr=subprocess.PIPE, text=True)
-    if ffprobe_process.returncode != 0:
-        logging.error(f'ffprobe failed subtitle check for file: {source_path}')
-        return {'copy': [], 'convert': []}
-    
-    stream_info = json.loads(ffprobe_process.stdout)
-    result = {'copy': [], 'convert': []}
-    
-    for stream in stream_info.get('streams', []):
+    if probe_data is None:
+        probe_data = probe_file(source_path)
+    audio = []
+    subtitles = {'copy': [], 'convert': []}
+
+    for stream in probe_data.get('streams', []):
+        codec_type = stream.get('codec_type')
+        if codec_type == 'audio':
+            audio.append(stream)
+            continue
+        if codec_type != 'subtitle':
+            continue
         codec = stream.get('codec_name', '')
         index = stream.get('index')
-        
+
         if not codec or index is None:
             # Unknown codec (e.g., WebVTT reported as empty) - skip
             logging.debug(f'Skipping subtitle stream {index} with unknown codec')
             continue
-        
+
         if codec in SUBTITLE_CODECS_COPY:
-            result['copy'].append((index, codec))
+            subtitles['copy'].append((index, codec))
         elif codec in SUBTITLE_CODECS_CONVERT:
-            result['convert'].append((index, codec))
+            subtitles['convert'].append((index, codec))
         else:
             logging.debug(f'Skipping unsupported subtitle codec: {codec} (stream {index})')
-    
-    return result
+
+    return {'audio': audio, 'subtitles': subtitles}
+
+@functools.lru_cache(maxsize=4096)
+def dest_paths(source_path):
+    """
+    Map a source file to its (final, temp) destination paths.
+
+    Returns (None, None) for files that are themselves transcoded
+    versions. Shared by the encode and delete paths - the same string
+    surgery used to be duplicated at each site - and memoized because
+    the same path is recomputed on every event it generates.
+    """
+    relative_path = os.path.relpath(source_path, SOURCE_FOLDER)
+    dest_path = os.path.join(DEST_FOLDER, relative_path)
+    dest_dir = os.path.dirname(dest_path)
+    source_name, _ = os.path.splitext(os.path.basename(dest_path))
+
+    # For same-folder multi-version encoding, use version-aware naming
+    # This replaces quality suffix (e.g., "- 1080p" -> "- 720p")
+    if _SAME_FOLDER_MODE and SYMLINK_VERSION_SUFFIX:
+        output_name = get_version_output_name(source_name)
+        if output_name is None:
+            return None, None
+        dest_file_final = os.path.join(dest_dir, f"{output_name}.mkv")
+    else:
+        dest_file_final = os.path.join(dest_dir, f"{source_name}.mkv")
+    return dest_file_final, dest_file_final + ".tmp"
+
+
+# Guards check-and-set on the shared processing state now that workers
+# are threads in one process
+_state_lock = threading.Lock()
+
+
+def _run_ffmpeg(command, label):
+    """
+    Run an ffmpeg command and return its exit code.
+
+    Expects -progress pipe:1 output: the key=value feed is folded into
+    one aggregated log line every ~10s; anything that isn't key=value is
+    a real error line and is logged as-is.
+    """
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    progress = {}
+    last_progress_log = 0.0
+    for line in process.stdout:
+        line = line.strip()
+        key, sep, value = line.partition('=')
+        if not sep:
+            if line:
+                logging.info(line)
+            continue
+        progress[key] = value
+        if key == 'progress':
+            now = time.monotonic()
+            if value == 'end' or now - last_progress_log >= 10:
+                last_progress_log = now
+                logging.info(
+                    f'Encoding {label}: '
+                    f"frame={progress.get('frame', '?')} "
+                    f"fps={progress.get('fps', '?')} "
+                    f"bitrate={progress.get('bitrate', '?')} "
+                    f"time={progress.get('out_time', '?')}")
+    return process.wait()
+
 
 def encode_video(source_path, processed_files, processing_files):
-    if processing_files.get(source_path):
-        logging.info(f'Already processing: {source_path}')
-        return
-    
-    # Skip files that are already 720p or lower quality - no need to transcode
-    if is_already_low_quality(source_path):
-        logging.info(f'Skipping low quality file (already 720p or lower): {source_path}')
-        return
-    
-    # Log metadata if available (for debugging/verification)
-    metadata = get_metadata_info(source_path)
-    if metadata:
-        logging.info(f'Metadata for {os.path.basename(source_path)}: {metadata}')
-    
-    processing_files[source_path] = True
+    with _state_lock:
+        if source_path in processing_files:
+            logging.info(f'Already processing: {source_path}')
+            return
+        processing_files.add(source_path)
 
     try:
-        relative_path = os.path.relpath(source_path, SOURCE_FOLDER)
-        dest_path = os.path.join(DEST_FOLDER, relative_path)
-        dest_dir = os.path.dirname(dest_path)
-        os.makedirs(dest_dir, exist_ok=True)
+        # Probe the file once; resolution/metadata/audio/subtitle checks
+        # below all reuse this result instead of spawning their own ffprobe
+        probe_data = probe_file(source_path)
 
-        base_name = os.path.basename(dest_path)
-        source_name, _ = os.path.splitext(base_name)
-        
-        # For same-folder multi-version encoding, use version-aware naming
-        # This replaces quality suffix (e.g., "- 1080p" -> "- 720p")
-        same_folder_mode = os.path.normpath(SOURCE_FOLDER) == os.path.normpath(DEST_FOLDER)
-        if same_folder_mode and SYMLINK_VERSION_SUFFIX:
-            output_name = get_version_output_name(source_name)
-            if output_name is None:
-                logging.info(f'Skipping already transcoded file: {source_path}')
-                return
-            dest_file_final = os.path.join(dest_dir, f"{output_name}.mkv")
-        else:
-            dest_file_final = os.path.join(dest_dir, f"{source_name}.mkv")
-        
-        dest_file_temp = dest_file_final + ".tmp"
+        # Skip files that are already 720p or lower quality - no need to transcode
+        if is_already_low_quality(source_path, probe_data):
+            logging.info(f'Skipping low quality file (already 720p or lower): {source_path}')
+            return
 
-        if os.path.exists(dest_file_temp):
+        # Log metadata if available (for debugging/verification)
+        metadata = get_metadata_info(source_path, probe_data)
+        if metadata:
+            logging.info(f'Metadata for {os.path.basename(source_path)}: {metadata}')
+
+        dest_file_final, dest_file_temp = dest_paths(source_path)
+        if dest_file_final is None:
+            logging.info(f'Skipping already transcoded file: {source_path}')
+            return
+        dest_dir = os.path.dirname(dest_file_final)
+        os.makedirs(dest_dir, exist_ok=True)
+
+        # Stat temp and final once each; every existence decision below
+        # branches on the cached results instead of re-statting (each
+        # os.path.exists is a network round-trip on NFS/SMB shares)
+        if _stat_or_none(dest_file_temp) is not None:
             if is_file_growing(dest_file_temp):
                 logging.info(f'Temp file {dest_file_temp} is currently growing; skipping deletion.')
                 # Skip processing this file
                 return
-            else:
-                logging.info(f'Deleting temp file: {dest_file_temp}')
-                os.remove(dest_file_temp)
+            logging.info(f'Deleting temp file: {dest_file_temp}')
+            os.remove(dest_file_temp)
 
-        if processed_files.get(dest_file_final):
+        if dest_file_final in processed_files:
             logging.info(f'Already processed: {dest_file_final}')
             return
 
-        if os.path.exists(dest_file_final) and verify_encoded_file(dest_file_final):
-            logging.info(f'Valid encoded file exists: {dest_file_final}')
-            processed_files[dest_file_final] = True
-            # Ensure version symlink exists even for previously encoded files
-            create_version_symlink(source_path, dest_file_final)
-            return
-        elif os.path.exists(dest_file_final):
+        if _stat_or_none(dest_file_final) is not None:
+            if verify_encoded_file_cached(dest_file_final):
+                logging.info(f'Valid encoded file exists: {dest_file_final}')
+                processed_files.add(dest_file_final)
+                # Ensure version symlink exists even for previously encoded files
+                create_version_symlink(source_path, dest_file_final)
+                return
             os.remove(dest_file_final)
-        if os.path.exists(dest_file_temp):
-            os.remove(dest_file_temp)
 
         if not wait_for_file_completion(source_path):
             return
 
-        quality_settings = {
-            'LOW': {'cq': {'av1': 45, 'hevc': 32}, 'crf': {'av1': 40, 'hevc': 30}},
-            'MEDIUM': {'cq': {'av1': 35, 'hevc': 26}, 'crf': {'av1': 35, 'hevc': 26}},
-            'HIGH': {'cq': {'av1': 28, 'hevc': 22}, 'crf': {'av1': 28, 'hevc': 22}},
-        }
-
-        quality = quality_settings.get(ENCODING_QUALITY, quality_settings['LOW'])
-
-        hw_enc_supported = True
-        video_encoder = []
-
-        if ENABLE_HW_ACCEL:
-            if HW_ENCODING_TYPE == 'nvidia':
-                if ENCODING_CODEC == 'av1':
-                    video_encoder = ['-c:v', 'av1_nvenc', '-preset', 'medium',
-                                     '-cq', str(quality['cq']['av1'])]
-                elif ENCODING_CODEC == 'hevc':
-                    video_encoder = ['-c:v', 'hevc_nvenc', '-preset', 'p5', '-rc', 'vbr_hq',
-                                     '-cq', str(quality['cq']['hevc']), '-b:v', '0']
-                else:
-                    logging.warning(f'NVIDIA encoding: Unsupported codec "{ENCODING_CODEC}". Defaulting to HEVC.')
-                    video_encoder = ['-c:v', 'hevc_nvenc', '-preset', 'p5', '-rc', 'vbr_hq',
-                                     '-cq', str(quality['cq']['hevc']), '-b:v', '0']
-
-            elif HW_ENCODING_TYPE == 'intel':
-                if ENCODING_CODEC == 'av1':
-                    video_encoder = ['-c:v', 'av1_qsv', '-preset', 'medium',
-                                     '-global_quality', str(quality['cq']['av1'])]
-                elif ENCODING_CODEC == 'hevc':
-                    video_encoder = ['-c:v', 'hevc_qsv', '-preset', 'medium',
-                                     '-global_quality', str(quality['cq']['hevc'])]
-                else:
-                    logging.warning(f'Intel encoding: Unsupported codec "{ENCODING_CODEC}". Defaulting to HEVC.')
-                    video_encoder = ['-c:v', 'hevc_qsv', '-preset', 'medium',
-                                     '-global_quality', str(quality['cq']['hevc'])]
-            else:
-                logging.error(f'Unsupported hardware acceleration "{HW_ENCODING_TYPE}". Falling back to software encoding.')
-                hw_enc_supported = False
-        else:
-            hw_enc_supported = False
-
-        if not hw_enc_supported:
-            # Software Encoding fallback
-            if ENCODING_CODEC == 'av1':
-                video_encoder = ['-c:v', 'libsvtav1', '-preset', '6', '-crf',
-                                 str(quality['crf']['av1']), '-cpu-used', '4']
-            elif ENCODING_CODEC == 'hevc':
-                video_encoder = ['-c:v', 'libx265', '-preset', 'medium', '-crf',
-                                 str(quality['crf']['hevc'])]
-            else:
-                logging.warning(f'Software encoding: Unsupported codec "{ENCODING_CODEC}". Defaulting to HEVC.')
-                video_encoder = ['-c:v', 'libx265', '-preset', 'medium', '-crf',
-                                 str(quality['crf']['hevc'])]
-
-        # Analyze audio streams with ffprobe
-        audio_streams = get_audio_streams(source_path)
+        # The probe above may have seen a file still being written (the
+        # watcher fires on creation, often before the header lands);
+        # re-probe now that the writer is done so stream selection and
+        # the remux size prediction see the finished file. The stat-keyed
+        # caches make this free when the file was already complete.
+        probe_data = probe_file(source_path)
+
+        # Same bytes under a new name (renamed/moved source): move the
+        # existing encode into place instead of re-encoding it. Only
+        # reclaim when the recorded source is actually gone - identical
+        # bytes under two live names (duplicate/hardlinked media) must
+        # each keep their own encode, not steal the shared one
+        fingerprint = _content_fingerprint(source_path)
+        if fingerprint:
+            entry = _lookup_content_index(fingerprint)
+            if entry:
+                existing, old_source = entry
+                if (existing != dest_file_final and os.path.exists(existing)
+                        and not os.path.exists(old_source)):
+                    logging.info(f'Reusing encode of renamed source: {existing} -> {dest_file_final}')
+                    atomic_replace(existing, dest_file_final)
+                    _update_content_index(fingerprint, dest_file_final, source_path)
+                    processed_files.add(dest_file_final)
+                    create_version_symlink(source_path, dest_file_final)
+                    return
+
+        video_encoder = VIDEO_ENCODER_ARGS
+
+        # Partition audio/subtitle streams from the cached probe
+        streams = get_streams(source_path, probe_data)
+        audio_streams = streams['audio']
         if not audio_streams:
             logging.error(f'No audio streams found in file: {source_path}')
             return
 
-        # Build the FFmpeg command
-        command = [
-            'ffmpeg', '-loglevel', 'verbose', '-y',
-            '-analyzeduration', '100M', '-probesize', '100M',
-            '-i', source_path,
-            '-map', '0:v:0',
-            '-vf', 'scale=-1:720'
-        ] + video_encoder
-
-        # Process each audio stream
-        for idx, stream in enumerate(audio_streams):
-            codec_name = stream['codec_name']
-            # Map the audio stream
-            command.extend(['-map', f'0:a:{idx}'])
-            # Re-encode all audio streams to AC3, downmixed to stereo
-            command.extend([f'-c:a:{idx}', 'ac3', f'-b:a:{idx}', '192k', f'-ac:a:{idx}', '2'])
-
-        # Map subtitles with smart codec handling for MKV compatibility
-        subtitle_streams = get_subtitle_streams(source_path)
-        sub_output_idx = 0
-        
-        # Copy-safe subtitles (can be copied directly to MKV)
-        for stream_idx, codec in subtitle_streams['copy']:
-            command.extend(['-map', f'0:{stream_idx}', f'-c:s:{sub_output_idx}', 'copy'])
-            sub_output_idx += 1
-        
-        # Subtitles that need conversion to SRT for MKV compatibility
-        for stream_idx, codec in subtitle_streams['convert']:
-            command.extend(['-map', f'0:{stream_idx}', f'-c:s:{sub_output_idx}', 'srt'])
-            sub_output_idx += 1
-        
-        if sub_output_idx == 0:
-            logging.info(f'No compatible subtitle streams found for: {os.path.basename(source_path)}')
-
-        # Set output format and destination file
-        command.extend(['-f', 'matroska', dest_file_temp])
-
-        logging.info(f'FFmpeg command: {" ".join(command)}')
-
-        # Run FFmpeg command
-        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-        for line in process.stdout:
-            logging.info(line.strip())
-
-        if process.wait() == 0:
-            if verify_encoded_file(dest_file_temp):
-                os.rename(dest_file_temp, dest_file_final)
-                processed_files[dest_file_final] = True
+        # Sources already at or below the size the encode would produce
+        # are remuxed into the destination instead - hours of CPU/GPU
+        # time would buy a negligible size win. Separate-folder mode
+        # only: in same-folder mode the "remux" would just drop a
+        # byte-identical full-size copy next to the source labeled as
+        # the 720p version, so there the file is skipped instead
+        remux = False
+        try:
+            duration_s = float(probe_data.get('format', {}).get('duration', 0))
+        except (TypeError, ValueError):
+            duration_s = 0.0
+        if duration_s > 0:
+            predicted_bytes = duration_s * EXPECTED_BPS / 8
+            source_stat = _stat_or_none(source_path)
+            if source_stat is not None and source_stat.st_size <= predicted_bytes * 1.1:
+                if _SAME_FOLDER_MODE:
+                    logging.info(f'Source is already near the predicted encode size '
+                                 f'({source_stat.st_size} <= 1.1 * {predicted_bytes:.0f} bytes); '
+                                 f'skipping (same-folder mode): {source_path}')
+                    return
+                logging.info(f'Source is already near the predicted encode size '
+                             f'({source_stat.st_size} <= 1.1 * {predicted_bytes:.0f} bytes); '
+                             f'remuxing instead of encoding: {source_path}')
+                remux = True
+
+        def build_command(hw_decode):
+            if remux:
+                return ['ffmpeg', '-loglevel', 'error', '-nostats', '-y',
+                        '-i', source_path, '-map', '0', '-c', 'copy',
+                        '-progress', 'pipe:1', '-f', 'matroska', dest_file_temp]
+
+            # Build the FFmpeg command; hw_decode keeps decode+scale on
+            # the GPU (NVENC path), otherwise both run on the CPU
+            command = ['ffmpeg', '-loglevel', 'error', '-nostats', '-y',
+                       '-analyzeduration', '100M', '-probesize', '100M']
+            if hw_decode:
+                command.extend(HWACCEL_INPUT_ARGS)
+            command.extend([
+                '-i', source_path,
+                '-map', '0:v:0',
+                '-vf', HW_SCALE_FILTER if hw_decode else 'scale=-1:720',
+            ])
+            command.extend(video_encoder)
+
+            # Process each audio stream
+            for idx, stream in enumerate(audio_streams):
+                # Map the audio stream
+                command.extend(['-map', f'0:a:{idx}'])
+                # Streams that are already mobile-friendly (stereo or
+                # mono AAC/AC3/E-AC3) are copied; everything else is
+                # re-encoded to AC3, downmixed to stereo
+                if (stream.get('codec_name') in ('aac', 'ac3', 'eac3')
+                        and stream.get('channels', 8) <= 2):
+                    command.extend([f'-c:a:{idx}', 'copy'])
+                else:
+                    command.extend([f'-c:a:{idx}', 'ac3', f'-b:a:{idx}', '192k', f'-ac:a:{idx}', '2'])
+
+            # Map subtitles with smart codec handling for MKV compatibility
+            sub_output_idx = 0
+
+            # Copy-safe subtitles (can be copied directly to MKV)
+            for stream_idx, codec in subtitle_streams['copy']:
+                command.extend(['-map', f'0:{stream_idx}', f'-c:s:{sub_output_idx}', 'copy'])
+                sub_output_idx += 1
+
+            # Subtitles that need conversion to SRT for MKV compatibility
+            for stream_idx, codec in subtitle_streams['convert']:
+                command.extend(['-map', f'0:{stream_idx}', f'-c:s:{sub_output_idx}', 'srt'])
+                sub_output_idx += 1
+
+            if sub_output_idx == 0:
+                logging.info(f'No compatible subtitle streams found for: {os.path.basename(source_path)}')
+
+            # Set output format and destination file. Progress goes to
+            # stdout as key=value blocks (-progress pipe:1)
+            command.extend(['-progress', 'pipe:1', '-f', 'matroska', dest_file_temp])
+            return command
+
+        subtitle_streams = streams['subtitles']
+
+        # Try the full-GPU pipeline first; NVDEC rejecting the input
+        # codec (e.g. AV1 on older GPUs) falls back to CPU decode+scale
+        attempts = (True, False) if HWACCEL_INPUT_ARGS and not remux else (False,)
+        returncode = -1
+        for hw_decode in attempts:
+            command = build_command(hw_decode)
+            logging.info(f'FFmpeg command: {" ".join(command)}')
+            returncode = _run_ffmpeg(command, os.path.basename(dest_file_final))
+            if returncode == 0:
+                break
+            if os.path.exists(dest_file_temp):
+                os.remove(dest_file_temp)
+            if hw_decode:
+                logging.warning(f'GPU decode pipeline failed for {source_path}; '
+                                'retrying with CPU decode and scale')
+
+        if returncode == 0:
+            # A clean ffmpeg exit already means the container was fully
+            # muxed; the extra ffprobe pass over a multi-GB output is
+            # opt-in via VERIFY_OUTPUT
+            if not VERIFY_OUTPUT or verify_encoded_file(dest_file_temp):
+                # Flush the hours of encode work to stable storage before
+                # publishing: without the fsyncs a power loss can leave a
+                # truncated final MKV that passes the existence check and
+                # never gets re-encoded
+                fd = os.open(dest_file_temp, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+                atomic_replace(dest_file_temp, dest_file_final)
+                if os.name == 'posix':
+                    dir_fd = os.open(dest_dir, os.O_RDONLY)
+                    try:
+                        os.fsync(dir_fd)
+                    finally:
+                        os.close(dir_fd)
+                # We just produced this file; record it as verified so a
+                # restart doesn't re-probe it
+                final_stat = _stat_or_none(dest_file_final)
+                if final_stat is not None:
+                    _verify_cache.put(dest_file_final, final_stat, True)
+                if fingerprint:
+                    _update_content_index(fingerprint, dest_file_final, source_path)
+                # The freshly written output won't be re-read by us;
+                # drop it from the page cache so it doesn't push out the
+                # sources other workers are still decoding
+                _fadvise(dest_file_final, 'POSIX_FADV_DONTNEED')
+                processed_files.add(dest_file_final)
                 logging.info(f'Encoding succeeded: {dest_file_final}')
                 
                 # Create version symlink for Jellyfin multi-version support
@@ -456,7 +949,50 @@ def encode_video(source_path, processed_files, processing_files):
             if os.path.exists(dest_file_temp):
                 os.remove(dest_file_temp)
     finally:
-        processing_files.pop(source_path, None)
+        processing_files.discard(source_path)
+        # Drop any close-event bookkeeping for this path, whichever exit
+        # we took: the early returns above never reach the wait, and a
+        # left-behind set event would make a later re-copy of the same
+        # path look complete while it is still being written
+        with _close_events_lock:
+            _close_events.pop(source_path, None)
+
+# On-disk index of version symlinks we created, mapping symlink path ->
+# destination file. Lets the periodic orphan cleanup iterate a small
+# mapping instead of walking the whole source tree.
+_SYMLINK_INDEX = os.path.join(DEST_FOLDER, '.symlink_index.json')
+_symlink_index_lock = threading.Lock()
+
+
+def _load_symlink_index():
+    """Return the index dict, or None when missing/unreadable."""
+    try:
+        with open(_SYMLINK_INDEX) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_symlink_index(index):
+    try:
+        tmp_path = _SYMLINK_INDEX + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f, indent=0)
+        os.rename(tmp_path, _SYMLINK_INDEX)
+    except OSError as e:
+        logging.error(f'Failed to write symlink index: {e}')
+
+
+def _update_symlink_index(symlink_path, dest_file=None):
+    """Record a symlink in the index, or drop it when dest_file is None."""
+    with _symlink_index_lock:
+        index = _load_symlink_index() or {}
+        if dest_file is None:
+            index.pop(symlink_path, None)
+        else:
+            index[symlink_path] = dest_file
+        _save_symlink_index(index)
+
 
 def create_version_symlink(source_path, dest_file_final):
     """
@@ -492,6 +1028,7 @@ def create_version_symlink(source_path, dest_file_final):
         # Create the symlink
         os.symlink(symlink_target, symlink_path)
         logging.info(f'Created version symlink: {symlink_path} -> {symlink_target}')
+        _update_symlink_index(symlink_path, dest_file_final)
         return symlink_path
     except Exception as e:
         logging.error(f'Failed to create version symlink for {source_path}: {e}')
@@ -512,49 +1049,183 @@ def delete_version_symlink(source_path):
         if os.path.islink(symlink_path):
             os.unlink(symlink_path)
             logging.info(f'Deleted version symlink: {symlink_path}')
+            _update_symlink_index(symlink_path, None)
     except Exception as e:
         logging.error(f'Failed to delete version symlink for {source_path}: {e}')
 
 
+# Fingerprints of already-encoded source content mapped to
+# [output file, source path], so a source that was merely renamed or
+# moved reuses its encode instead of burning hours redoing identical
+# bytes. The source path is what distinguishes a rename (old name gone,
+# reclaim the encode) from duplicate media (old name still present,
+# each copy keeps its own encode).
+_CONTENT_INDEX = os.path.join(DEST_FOLDER, '.content_index.json')
+_content_index_lock = threading.Lock()
+
+
+def _content_fingerprint(path):
+    """sha256 over first + last 64 KiB plus size: stable under rename."""
+    try:
+        size = os.path.getsize(path)
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            digest.update(f.read(65536))
+            if size > 131072:
+                f.seek(-65536, os.SEEK_END)
+                digest.update(f.read(65536))
+        digest.update(str(size).encode())
+        return digest.hexdigest()
+    except OSError:
+        return None
+
+
+def _lookup_content_index(fingerprint):
+    """Return the recorded (dest_file, source_path) pair, or None."""
+    with _content_index_lock:
+        try:
+            with open(_CONTENT_INDEX) as f:
+                entry = json.load(f).get(fingerprint)
+        except (OSError, ValueError):
+            return None
+    # Entries written before the source path was recorded can't be
+    # reclaimed safely; treat them as missing
+    if isinstance(entry, list) and len(entry) == 2:
+        return entry
+    return None
+
+
+def _update_content_index(fingerprint, dest_file, source_path):
+    with _content_index_lock:
+        try:
+            with open(_CONTENT_INDEX) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        index[fingerprint] = [dest_file, source_path]
+        try:
+            tmp_path = _CONTENT_INDEX + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(index, f, indent=0)
+            os.rename(tmp_path, _CONTENT_INDEX)
+        except OSError as e:
+            logging.error(f'Failed to write content index: {e}')
+
+
 def delete_encoded_video(source_path):
-    relative_path = os.path.relpath(source_path, SOURCE_FOLDER)
-    dest_path = os.path.join(DEST_FOLDER, relative_path)
-    dest_dir = os.path.dirname(dest_path)
-    source_name, _ = os.path.splitext(os.path.basename(dest_path))
-    
-    # For same-folder mode, use version-aware naming
-    same_folder_mode = os.path.normpath(SOURCE_FOLDER) == os.path.normpath(DEST_FOLDER)
-    if same_folder_mode and SYMLINK_VERSION_SUFFIX:
-        output_name = get_version_output_name(source_name)
-        if output_name:
-            encoded_file = os.path.join(dest_dir, f"{output_name}.mkv")
-        else:
-            return  # This was a transcoded file itself
-    else:
-        encoded_file = os.path.join(dest_dir, f"{source_name}.mkv")
-    
-    temp_file = encoded_file + ".tmp"
+    encoded_file, temp_file = dest_paths(source_path)
+    if encoded_file is None:
+        return  # This was a transcoded file itself
+
     for f in [encoded_file, temp_file]:
         if os.path.exists(f):
             os.remove(f)
             logging.info(f'Deleted: {f}')
     
     # Also delete the version symlink (only relevant for separate-folder mode)
-    if not same_folder_mode:
+    if not _SAME_FOLDER_MODE:
         delete_version_symlink(source_path)
 
 
+def _walk_files(root):
+    """
+    Yield the path of every non-directory entry under root.
+
+    Uses os.scandir with cached entry types instead of os.walk, avoiding
+    the per-file stat calls that dominate scans of large libraries.
+    Symlinks are yielded too (callers filter with islink where relevant).
+    """
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        else:
+                            yield entry.path
+                    except OSError:
+                        continue
+        except OSError as e:
+            logging.debug(f'Cannot scan {current}: {e}')
+
+
+def _scan_subtree(root):
+    return [path for path in _walk_files(root) if is_video_file(path)]
+
+
 def scan_source_directory():
-    files = []
-    for root, _, filenames in os.walk(SOURCE_FOLDER):
-        for file in filenames:
-            if is_video_file(file):
-                files.append(os.path.join(root, file))
+    """
+    Collect all video files under SOURCE_FOLDER.
+
+    Top-level subdirectories are walked in parallel: directory listing is
+    I/O-latency-bound, so overlapping the getdents round-trips helps a
+    lot on NFS-hosted libraries.
+    """
+    try:
+        with os.scandir(SOURCE_FOLDER) as it:
+            entries = list(it)
+    except OSError as e:
+        logging.error(f'Cannot scan source folder "{SOURCE_FOLDER}": {e}')
+        return []
+
+    files, subdirs = [], []
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+            elif is_video_file(entry.path):
+                files.append(entry.path)
+        except OSError:
+            continue
+
+    if subdirs:
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=min(16, len(subdirs))) as pool:
+            for subtree_files in pool.map(_scan_subtree, subdirs):
+                files.extend(subtree_files)
     return files
 
 
+# Unbounded work queue. It must never block the producer: on_created
+# runs on watchdog's single dispatch thread, which also delivers the
+# on_closed events the workers wait on - a blocking put there would
+# deadlock every worker behind it until the wait times out. Memory is
+# still bounded in practice by the dedup set below (one queued entry
+# per distinct pending path).
+task_queue = queue.Queue()
+
+# Paths currently enqueued, so duplicate notifications for the same file
+# (watcher event racing the startup scan, re-created files) coalesce
+# into one task instead of queueing up behind each other
+_pending_tasks = set()
+_pending_tasks_lock = threading.Lock()
+
+
 def submit_encoding_task(file_path):
-    executor.submit(encode_video, file_path, processed_files, processing_files)
+    with _pending_tasks_lock:
+        if file_path in _pending_tasks:
+            return
+        _pending_tasks.add(file_path)
+    task_queue.put(file_path)
+
+
+def encode_worker(processed_files, processing_files):
+    """Drain the task queue until a None sentinel arrives."""
+    while True:
+        file_path = task_queue.get()
+        try:
+            if file_path is None:
+                return
+            with _pending_tasks_lock:
+                _pending_tasks.discard(file_path)
+            encode_video(file_path, processed_files, processing_files)
+        except Exception as e:
+            logging.error(f'Unhandled error encoding {file_path}: {e}')
+        finally:
+            task_queue.task_done()
 
 def cleanup_destination():
     """
@@ -571,88 +1242,153 @@ def cleanup_destination():
                       'abort clean-up.')
         return
 
-    source_rel = {os.path.relpath(p, SOURCE_FOLDER) for p in scan_source_directory()}
-    if not source_rel:
+    # One pass over the source scan: relpath -> stem directly, using
+    # rpartition instead of splitext (every video name has an extension,
+    # is_video_file guarantees it)
+    source_stems = {os.path.relpath(p, SOURCE_FOLDER).rpartition('.')[0]
+                    for p in scan_source_directory()}
+    if not source_stems:
         logging.warning('Source contains no video files – '
                         'skip clean-up to protect library.')
         return
 
-    # Pre-compute the stem (path without ext) of every source video
-    source_stems = {os.path.splitext(p)[0] for p in source_rel}
-
-    for root, _, files in os.walk(DEST_FOLDER):
-        for file in files:
-            full_path = os.path.join(root, file)
-
-            # We only touch our own output
-            if not file.lower().endswith(('.mkv', '.mkv.tmp')):
-                continue
-
-            rel_dest = os.path.relpath(full_path, DEST_FOLDER)
-            dest_stem, dest_ext = os.path.splitext(rel_dest)          # *.mkv or *.mkv.tmp
-            if dest_ext == '.tmp':
-                dest_stem, _ = os.path.splitext(dest_stem)            # strip second ext
+    # Every dest name we would legitimately produce from the current
+    # source tree, built once so orphan detection is a hashed set
+    # difference instead of per-file string surgery
+    expected = {stem + '.mkv' for stem in source_stems}
+    expected.update(stem + '.mkv.tmp' for stem in source_stems)
+
+    dest_files = {}
+    for full_path in _walk_files(DEST_FOLDER):
+        file = os.path.basename(full_path)
+
+        # We only touch our own output; we always write lowercase
+        # extensions, so no per-file lower() needed here
+        if file.endswith('.mkv') or file.endswith('.mkv.tmp'):
+            dest_files[os.path.relpath(full_path, DEST_FOLDER)] = full_path
+
+    orphans = dest_files.keys() - expected
+
+    # extra guard for *.tmp : keep it if still being written. Each growth
+    # check sleeps 10s, so run them concurrently - N stale temp files
+    # cost one interval instead of N
+    tmp_orphans = [rel for rel in orphans if rel.endswith('.tmp')]
+    growing = {}
+    if tmp_orphans:
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=min(32, len(tmp_orphans))) as pool:
+            growing = dict(zip(tmp_orphans, pool.map(
+                is_file_growing, (dest_files[rel] for rel in tmp_orphans))))
+
+    for rel_dest in orphans:
+        full_path = dest_files[rel_dest]
+
+        if growing.get(rel_dest):
+            logging.info(f'Skip active tmp file: {full_path}')
+            continue
+        try:
+            os.remove(full_path)
+            logging.info(f'Removed orphaned encode: {full_path}')
 
-            if dest_stem not in source_stems:
-                # extra guard for *.tmp : keep it if still being written
-                if file.endswith('.tmp') and is_file_growing(full_path):
-                    logging.info(f'Skip active tmp file: {full_path}')
-                    continue
-                try:
-                    os.remove(full_path)
-                    logging.info(f'Removed orphaned encode: {full_path}')
-                    
-                    # Also remove the corresponding symlink in source folder
-                    source_file_path = os.path.join(SOURCE_FOLDER, dest_stem + '.mkv')
-                    delete_version_symlink(source_file_path)
-                except Exception as e:
-                    logging.error(f'Failed to delete {full_path}: {e}')
+            # Also remove the corresponding symlink in source folder
+            dest_stem = rel_dest[:-8] if rel_dest.endswith('.mkv.tmp') else rel_dest[:-4]
+            source_file_path = os.path.join(SOURCE_FOLDER, dest_stem + '.mkv')
+            delete_version_symlink(source_file_path)
+        except Exception as e:
+            logging.error(f'Failed to delete {full_path}: {e}')
 
 
 def cleanup_orphaned_symlinks():
     """
     Remove version symlinks in SOURCE_FOLDER that point to
     non-existent destination files.
+
+    Iterates the on-disk symlink index when one exists; a full source
+    tree walk only happens once to build the initial index.
     """
     if not SYMLINK_TARGET_PREFIX:
         return
-    
+
     logging.info('Cleaning up orphaned version symlinks...')
-    suffix = SYMLINK_VERSION_SUFFIX + '.mkv'
-    
-    for root, _, files in os.walk(SOURCE_FOLDER):
-        for file in files:
-            if not file.endswith(suffix):
-                continue
-            
-            full_path = os.path.join(root, file)
-            if not os.path.islink(full_path):
-                continue
-            
-            # Check if the symlink target exists
-            target = os.readlink(full_path)
-            # The target is an absolute path on the source host, but we need to
-            # check if the corresponding file exists in DEST_FOLDER
+    with _symlink_index_lock:
+        index = _load_symlink_index()
+
+    if index is not None:
+        stale = []
+        for symlink_path, dest_file in index.items():
             try:
-                # Extract relative path from symlink target
-                rel_path = os.path.relpath(target, SYMLINK_TARGET_PREFIX)
-                dest_file = os.path.join(DEST_FOLDER, rel_path)
-                
-                if not os.path.exists(dest_file):
-                    os.unlink(full_path)
-                    logging.info(f'Removed orphaned symlink: {full_path}')
+                if not os.path.islink(symlink_path):
+                    stale.append(symlink_path)
+                elif not os.path.exists(dest_file):
+                    os.unlink(symlink_path)
+                    logging.info(f'Removed orphaned symlink: {symlink_path}')
+                    stale.append(symlink_path)
             except Exception as e:
-                logging.error(f'Error checking symlink {full_path}: {e}')
+                logging.error(f'Error checking symlink {symlink_path}: {e}')
+        if stale:
+            with _symlink_index_lock:
+                current = _load_symlink_index() or {}
+                for symlink_path in stale:
+                    current.pop(symlink_path, None)
+                _save_symlink_index(current)
+        return
+
+    # No index yet - fall back to the full walk and build one as we go
+    index = {}
+    suffix = _VERSION_MKV_SUFFIX
+
+    for full_path in _walk_files(SOURCE_FOLDER):
+        if not full_path.endswith(suffix):
+            continue
+
+        if not os.path.islink(full_path):
+            continue
+
+        # Check if the symlink target exists
+        target = os.readlink(full_path)
+        # The target is an absolute path on the source host, but we need to
+        # check if the corresponding file exists in DEST_FOLDER
+        try:
+            # Extract relative path from symlink target
+            rel_path = os.path.relpath(target, SYMLINK_TARGET_PREFIX)
+            dest_file = os.path.join(DEST_FOLDER, rel_path)
+
+            if not os.path.exists(dest_file):
+                os.unlink(full_path)
+                logging.info(f'Removed orphaned symlink: {full_path}')
+            else:
+                index[full_path] = dest_file
+        except Exception as e:
+            logging.error(f'Error checking symlink {full_path}: {e}')
+
+    with _symlink_index_lock:
+        _save_symlink_index(index)
 
 CLEANUP_INTERVAL_HOURS = int(os.getenv('CLEANUP_INTERVAL_HOURS', '6'))
 
+
+def periodic_cleanup():
+    """Run the cleanup passes and reschedule the next run."""
+    logging.info('Running periodic cleanup...')
+    cleanup_destination()
+    cleanup_orphaned_symlinks()
+    _save_caches()
+    timer = threading.Timer(CLEANUP_INTERVAL_HOURS * 3600, periodic_cleanup)
+    timer.daemon = True
+    timer.start()
+
+
 if __name__ == "__main__":
-    freeze_support()
-    manager = Manager()
-    processed_files, processing_files = manager.dict(), manager.dict()
-    max_workers = 1 if ENABLE_HW_ACCEL else (os.cpu_count() or 1)
-    logging.info(f'Running with {max_workers} workers')
-    executor = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers)
+    processed_files, processing_files = set(), set()
+    # ffmpeg does the heavy lifting in its own process, so threads are
+    # enough here. NVENC/QSV handle a couple of concurrent sessions.
+    logging.info(f'Running with {MAX_WORKERS} workers ({FFMPEG_THREADS} ffmpeg threads each)')
+    workers = [threading.Thread(target=encode_worker,
+                                args=(processed_files, processing_files),
+                                daemon=True)
+               for _ in range(MAX_WORKERS)]
+    for worker in workers:
+        worker.start()
 
     cleanup_destination()
     cleanup_orphaned_symlinks()
@@ -662,22 +1398,32 @@ if __name__ == "__main__":
     observer.start()
 
     logging.info('Monitoring started.')
-    for file_path in scan_source_directory():
+    initial_files = scan_source_directory()
+    if SCHED_ORDER in ('sjf', 'lpt'):
+        def _size_or_zero(path):
+            try:
+                return os.path.getsize(path)
+            except OSError:
+                return 0
+        initial_files.sort(key=_size_or_zero, reverse=(SCHED_ORDER == 'lpt'))
+    for file_path in initial_files:
         submit_encoding_task(file_path)
 
-    last_cleanup = time.time()
-    cleanup_interval_seconds = CLEANUP_INTERVAL_HOURS * 3600
+    # Periodic cleanup to catch orphaned files; the timer reschedules
+    # itself, so the main thread just sleeps until shutdown
+    cleanup_timer = threading.Timer(CLEANUP_INTERVAL_HOURS * 3600, periodic_cleanup)
+    cleanup_timer.daemon = True
+    cleanup_timer.start()
 
+    stop_event = threading.Event()
     try:
-        while True:
-            time.sleep(60)  # Check every minute
-            # Periodic cleanup to catch orphaned files
-            if time.time() - last_cleanup > cleanup_interval_seconds:
-                logging.info('Running periodic cleanup...')
-                cleanup_destination()
-                cleanup_orphaned_symlinks()
-                last_cleanup = time.time()
+        stop_event.wait()
     except KeyboardInterrupt:
+        stop_event.set()
         observer.stop()
     observer.join()
-    executor.shutdown(wait=True)
\ No newline at end of file
+    # Drain the workers: one sentinel each, then wait for in-flight encodes
+    for _ in workers:
+        task_queue.put(None)
+    for worker in workers:
+        worker.join()
\ No newline at end of file
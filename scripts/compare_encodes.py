@@ -36,14 +36,15 @@ from __future__ import annotations
 
 import argparse
 import csv
-import io
 import json
 import os
 import re
 import sys
+from operator import attrgetter
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, List, Optional, Set, Tuple
+from typing import Dict, List, Optional, Set, TextIO, Tuple
 
 
 # ============================================================================
@@ -53,45 +54,56 @@ from typing import Dict, List, Optional, Set, Tuple
 # Video file extensions to consider
 VIDEO_EXTENSIONS = {'.mp4', '.mkv', '.avi', '.mov', '.wmv', '.flv', '.mpeg', '.mpg', '.webm'}
 
-# Default patterns to ignore (macOS resource forks, temp files, etc.)
-DEFAULT_IGNORE_PATTERNS = [
-    r'^\._',           # macOS resource fork files
-    r'\.tmp$',         # Temporary files
-    r'\.part$',        # Partial downloads
-    r'\.!qB$',         # qBittorrent incomplete files
-    r'^\.DS_Store$',   # macOS folder metadata
-    r'^Thumbs\.db$',   # Windows thumbnail cache
-]
+# Tuple form for str.endswith: one C-level scan per name, no splitext
+# allocation (the scan hot loop lowercases each name exactly once and
+# reuses it for both the extension and ignore checks)
+VIDEO_EXT_TUPLE = tuple(sorted(VIDEO_EXTENSIONS))
+
+# Default names to ignore (macOS resource forks, temp files, etc.).
+# These are all fixed literals or anchored prefixes/suffixes, so they
+# are matched with plain string ops; only user-supplied patterns pay
+# for the regex engine. All entries are lowercase (checks case-fold).
+IGNORE_EXACT = frozenset({'.ds_store', 'thumbs.db'})
+IGNORE_PREFIXES = ('._',)          # macOS resource fork files
+IGNORE_SUFFIXES = ('.tmp',         # Temporary files
+                   '.part',        # Partial downloads
+                   '.!qb')         # qBittorrent incomplete files
 
 # Quality markers in filenames that indicate the file is already low quality
 LOW_QUALITY_MARKERS = ['720p', '480p', '360p', 'sd', 'dvdrip', 'hdtv', 'webrip']
 HIGH_QUALITY_MARKERS = ['1080p', '2160p', '4k', 'uhd', 'bluray', 'bdremux', 'remux']
 
+# Fused into one alternation each: a single C-level scan per name
+# replaces the per-marker substring loop
+_LOW_QUALITY_RE = re.compile("|".join(map(re.escape, LOW_QUALITY_MARKERS)))
+_HIGH_QUALITY_RE = re.compile("|".join(map(re.escape, HIGH_QUALITY_MARKERS)))
+
 
 # ============================================================================
 # Data Classes
 # ============================================================================
 
-@dataclass
+@dataclass(slots=True)
 class VideoFile:
     """Represents a video file with its metadata."""
-    path: Path
+    path: str
     relative_path: str
     stem: str  # filename without extension
     size: int
-    
+    # Lazily computed by size_human; every formatter reads the property
+    # so the conversion would otherwise run up to once per output pass
+    _size_human: Optional[str] = field(default=None, repr=False, compare=False)
+
     @property
     def size_human(self) -> str:
-        """Return human-readable file size."""
-        size = self.size
-        for unit in ('B', 'KiB', 'MiB', 'GiB', 'TiB'):
-            if size < 1024 or unit == 'TiB':
-                return f"{size:,.1f} {unit}"
-            size /= 1024
-        return f"{size:,.1f} TiB"
+        """Return human-readable file size (computed once, then cached)."""
+        cached = self._size_human
+        if cached is None:
+            cached = self._size_human = _human_size(self.size)
+        return cached
 
 
-@dataclass
+@dataclass(slots=True)
 class ComparisonResult:
     """Results of comparing source and destination folders."""
     source_folder: Path
@@ -118,107 +130,186 @@ class ComparisonResult:
     
     @property
     def total_missing_size(self) -> int:
-        return sum(f.size for f in self.missing_encodes)
-    
+        return sum(map(attrgetter('size'), self.missing_encodes))
+
     @property
     def total_orphaned_size(self) -> int:
-        return sum(f.size for f in self.orphaned_encodes)
+        return sum(map(attrgetter('size'), self.orphaned_encodes))
 
 
 # ============================================================================
 # Core Functions
 # ============================================================================
 
-def compile_ignore_patterns(additional_patterns: Optional[List[str]] = None) -> List[re.Pattern]:
-    """Compile ignore patterns into regex objects."""
-    patterns = DEFAULT_IGNORE_PATTERNS.copy()
-    if additional_patterns:
-        patterns.extend(additional_patterns)
-    return [re.compile(p, re.IGNORECASE) for p in patterns]
+def compile_ignore_patterns(additional_patterns: Optional[List[str]] = None) -> Optional[re.Pattern]:
+    """
+    Compile user-supplied ignore patterns into a single alternation regex.
+
+    The built-in rules are handled as literal string checks in
+    should_ignore; returns None when there are no extra patterns.
+    """
+    if not additional_patterns:
+        return None
+    # One fused pattern means one C-level scan per filename instead of a
+    # Python loop invoking the regex engine once per pattern
+    return re.compile("|".join(f"(?:{p})" for p in additional_patterns), re.IGNORECASE)
 
 
-def should_ignore(filename: str, patterns: List[re.Pattern]) -> bool:
-    """Check if a filename should be ignored based on patterns."""
-    return any(p.search(filename) for p in patterns)
+def should_ignore(name_lower: str, patterns: Optional[re.Pattern]) -> bool:
+    """
+    Check if a filename should be ignored (built-in rules + extras).
+    Expects an already-lowercased name; extra patterns are compiled
+    case-insensitive, so matching against the lowered form is safe.
+    """
+    if (name_lower in IGNORE_EXACT
+            or name_lower.startswith(IGNORE_PREFIXES)
+            or name_lower.endswith(IGNORE_SUFFIXES)):
+        return True
+    return patterns is not None and patterns.search(name_lower) is not None
 
 
-def is_video_file(path: Path, ignore_patterns: List[re.Pattern]) -> bool:
+def is_video_file(path: Path, ignore_patterns: Optional[re.Pattern]) -> bool:
     """Check if a path is a valid video file."""
     if not path.is_file():
         return False
     
     if path.suffix.lower() not in VIDEO_EXTENSIONS:
         return False
-    
-    if should_ignore(path.name, ignore_patterns):
+
+    if should_ignore(path.name.lower(), ignore_patterns):
         return False
-    
+
     return True
 
 
-def is_low_quality(filename: str) -> bool:
+def is_low_quality(name_lower: str) -> bool:
     """
     Check if a file appears to be low quality based on filename markers.
-    Returns True if the file is likely 720p or lower.
+    Expects an already-lowercased name; returns True if likely 720p or lower.
     """
-    name_lower = filename.lower()
-    
-    has_low = any(marker in name_lower for marker in LOW_QUALITY_MARKERS)
-    has_high = any(marker in name_lower for marker in HIGH_QUALITY_MARKERS)
-    
     # If it has high quality markers, it's not low quality
-    if has_high:
+    if _HIGH_QUALITY_RE.search(name_lower):
         return False
-    
+
     # If it has low quality markers, it is low quality
-    return has_low
+    return _LOW_QUALITY_RE.search(name_lower) is not None
+
 
+# Light per-file record produced by the scan: (entry, relative_path, stem).
+# Stat and VideoFile construction are deferred until a file is actually
+# reported - matched files (usually the majority) never need their size.
+# The DirEntry is kept because its stat() caches: if is_file() already
+# had to stat (symlinks), or the platform prefetches file info during
+# the directory read (Windows), reporting pays no extra syscall.
+_ScanRecord = Tuple[os.DirEntry, str, str]
 
-def scan_folder(folder: Path, ignore_patterns: List[re.Pattern]) -> Dict[str, VideoFile]:
+
+def scan_folder(folder: Path, ignore_patterns: Optional[re.Pattern]) -> Dict[str, _ScanRecord]:
     """
     Scan a folder recursively for video files.
-    Returns a dict mapping relative stems (path without extension) to VideoFile objects.
+    Returns a dict mapping lowercased relative stems to scan records.
     """
-    files: Dict[str, VideoFile] = {}
-    ignored: List[str] = []
-    
+    files: Dict[str, _ScanRecord] = {}
+
     if not folder.exists():
         print(f"Warning: Folder does not exist: {folder}", file=sys.stderr)
         return files
-    
-    for path in folder.rglob('*'):
-        if not path.is_file():
-            continue
-        
-        if path.suffix.lower() not in VIDEO_EXTENSIONS:
-            continue
-        
-        if should_ignore(path.name, ignore_patterns):
-            ignored.append(str(path.relative_to(folder)))
+
+    try:
+        with os.scandir(str(folder)) as it:
+            entries = list(it)
+    except OSError:
+        return files
+
+    subdirs: List[Tuple[str, str]] = []
+    for entry in entries:
+        try:
+            is_dir = entry.is_dir(follow_symlinks=False)
+        except OSError:
             continue
-        
-        relative = path.relative_to(folder)
-        stem = str(relative.with_suffix(''))
-        
+        if is_dir:
+            subdirs.append((entry.path, entry.name))
+        else:
+            _add_video_entry(entry, entry.name, ignore_patterns, files)
+
+    # Walk subtrees in parallel: the scan is blocked on metadata
+    # syscalls, and scandir/stat release the GIL, so threads overlap the
+    # latency (biggest win on NFS or spinning disks)
+    if subdirs:
+        with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as pool:
+            futures = [pool.submit(_scan_subtree, dir_path, rel_dir, ignore_patterns)
+                       for dir_path, rel_dir in subdirs]
+            for future in futures:
+                files.update(future.result())
+
+    return files
+
+
+def _scan_subtree(dir_path: str, rel_dir: str,
+                  ignore_patterns: Optional[re.Pattern]) -> Dict[str, _ScanRecord]:
+    """
+    Walk one subtree iteratively with os.scandir.
+
+    Entry types come cached from the directory read, so no entry pays a
+    stat during the scan; the relative path is accumulated during the
+    walk.
+    """
+    files: Dict[str, _ScanRecord] = {}
+    stack: List[Tuple[str, str]] = [(dir_path, rel_dir)]
+    while stack:
+        current, rel_current = stack.pop()
         try:
-            size = path.stat().st_size
-        except (OSError, IOError):
-            size = 0
-        
-        files[stem.lower()] = VideoFile(
-            path=path,
-            relative_path=str(relative),
-            stem=stem,
-            size=size
-        )
-    
+            entries = os.scandir(current)
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                relative = os.path.join(rel_current, entry.name)
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append((entry.path, relative))
+                        continue
+                except OSError:
+                    continue
+                _add_video_entry(entry, relative, ignore_patterns, files)
     return files
 
 
+def _add_video_entry(entry: os.DirEntry, relative: str,
+                     ignore_patterns: Optional[re.Pattern],
+                     files: Dict[str, _ScanRecord]) -> None:
+    """Record a directory entry in files if it is a non-ignored video."""
+    try:
+        if not entry.is_file():
+            return
+    except OSError:
+        return
+
+    name_lower = entry.name.lower()
+    if not name_lower.endswith(VIDEO_EXT_TUPLE):
+        return
+
+    if should_ignore(name_lower, ignore_patterns):
+        return
+
+    stem = os.path.splitext(relative)[0]
+    files[stem.lower()] = (entry, relative, stem)
+
+
+def _make_video_file(record: _ScanRecord) -> VideoFile:
+    """Materialize a VideoFile (at most one stat) for reporting."""
+    entry, relative, stem = record
+    try:
+        size = entry.stat().st_size
+    except (OSError, IOError):
+        size = 0
+    return VideoFile(path=entry.path, relative_path=relative, stem=stem, size=size)
+
+
 def compare_folders(
     source_folder: Path,
     dest_folder: Path,
-    ignore_patterns: List[re.Pattern],
+    ignore_patterns: Optional[re.Pattern],
     check_low_quality: bool = True
 ) -> ComparisonResult:
     """
@@ -226,37 +317,61 @@ def compare_folders(
     """
     result = ComparisonResult(source_folder=source_folder, dest_folder=dest_folder)
     
-    # Scan both folders
+    # Scan both folders concurrently - they are independent trees
+    # (often on different volumes), so their I/O latencies overlap
     print(f"Scanning source folder: {source_folder}", file=sys.stderr)
-    source_files = scan_folder(source_folder, ignore_patterns)
-    
     print(f"Scanning destination folder: {dest_folder}", file=sys.stderr)
-    dest_files = scan_folder(dest_folder, ignore_patterns)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        source_future = pool.submit(scan_folder, source_folder, ignore_patterns)
+        dest_future = pool.submit(scan_folder, dest_folder, ignore_patterns)
+        source_files = source_future.result()
+        dest_files = dest_future.result()
     
     result.total_source_files = len(source_files)
     result.total_dest_files = len(dest_files)
     
-    source_stems = set(source_files.keys())
-    dest_stems = set(dest_files.keys())
-    
-    # Find files in source that have encoded versions
-    matched_stems = source_stems & dest_stems
-    result.matched_count = len(matched_stems)
-    
+    # dict.keys() views already implement the set protocol, so the
+    # operators below work without copying every key into fresh sets
+    source_stems = source_files.keys()
+    dest_stems = dest_files.keys()
+
+    if source_files and dest_files:
+        # Find files in source that have encoded versions. Probe the
+        # smaller table against the larger so the intersection costs
+        # O(min(n, m)) hash lookups - dest is usually the partial catalog
+        small, big = ((source_stems, dest_stems)
+                      if len(source_stems) <= len(dest_stems)
+                      else (dest_stems, source_stems))
+        result.matched_count = sum(1 for stem in small if stem in big)
+        missing_stems = source_stems - dest_stems
+        orphaned_stems = dest_stems - source_stems
+    else:
+        # One side is empty: nothing can match and the differences are
+        # just the other side's keys, so skip the set arithmetic
+        missing_stems = source_stems
+        orphaned_stems = dest_stems
+
     # Find missing encodes (in source but not in dest)
-    missing_stems = source_stems - dest_stems
-    for stem in sorted(missing_stems):
-        vf = source_files[stem]
-        if check_low_quality and is_low_quality(vf.relative_path):
+    for stem in missing_stems:
+        vf = _make_video_file(source_files[stem])
+        # The dict key is the stem already lowercased at scan time
+        if check_low_quality and is_low_quality(stem):
             result.skipped_low_quality.append(vf)
         else:
             result.missing_encodes.append(vf)
-    
+
     # Find orphaned encodes (in dest but not in source)
-    orphaned_stems = dest_stems - source_stems
-    for stem in sorted(orphaned_stems):
-        result.orphaned_encodes.append(dest_files[stem])
-    
+    for stem in orphaned_stems:
+        result.orphaned_encodes.append(_make_video_file(dest_files[stem]))
+
+    # Sort once for presentation - every formatter used to re-sort the
+    # same lists (and the old stem-order sorts didn't match the
+    # relative_path order the formatters wanted anyway)
+    by_path = lambda vf: vf.relative_path
+    result.missing_encodes.sort(key=by_path)
+    result.orphaned_encodes.sort(key=by_path)
+    result.skipped_low_quality.sort(key=by_path)
+
     return result
 
 
@@ -264,8 +379,8 @@ def compare_folders(
 # Output Formatters
 # ============================================================================
 
-def format_text(result: ComparisonResult, show_skipped: bool = False) -> str:
-    """Format comparison results as human-readable text."""
+def format_text(result: ComparisonResult, out: TextIO, show_skipped: bool = False) -> None:
+    """Write comparison results as human-readable text to ``out``."""
     lines = []
     
     lines.append("=" * 80)
@@ -290,21 +405,19 @@ def format_text(result: ComparisonResult, show_skipped: bool = False) -> str:
     
     # Missing encodes
     if result.missing_encodes:
-        total_size = sum(f.size for f in result.missing_encodes)
         lines.append("-" * 40)
-        lines.append(f"MISSING ENCODES ({len(result.missing_encodes)} files, {_human_size(total_size)} total)")
+        lines.append(f"MISSING ENCODES ({len(result.missing_encodes)} files, {_human_size(result.total_missing_size)} total)")
         lines.append("-" * 40)
-        for vf in sorted(result.missing_encodes, key=lambda x: x.relative_path):
+        for vf in result.missing_encodes:
             lines.append(f"  [{vf.size_human:>12}] {vf.relative_path}")
         lines.append("")
     
     # Orphaned encodes
     if result.orphaned_encodes:
-        total_size = sum(f.size for f in result.orphaned_encodes)
         lines.append("-" * 40)
-        lines.append(f"ORPHANED ENCODES ({len(result.orphaned_encodes)} files, {_human_size(total_size)} total)")
+        lines.append(f"ORPHANED ENCODES ({len(result.orphaned_encodes)} files, {_human_size(result.total_orphaned_size)} total)")
         lines.append("-" * 40)
-        for vf in sorted(result.orphaned_encodes, key=lambda x: x.relative_path):
+        for vf in result.orphaned_encodes:
             lines.append(f"  [{vf.size_human:>12}] {vf.relative_path}")
         lines.append("")
     
@@ -313,7 +426,7 @@ def format_text(result: ComparisonResult, show_skipped: bool = False) -> str:
         lines.append("-" * 40)
         lines.append(f"SKIPPED - LOW QUALITY ({len(result.skipped_low_quality)} files)")
         lines.append("-" * 40)
-        for vf in sorted(result.skipped_low_quality, key=lambda x: x.relative_path):
+        for vf in result.skipped_low_quality:
             lines.append(f"  [{vf.size_human:>12}] {vf.relative_path}")
         lines.append("")
     
@@ -329,12 +442,30 @@ def format_text(result: ComparisonResult, show_skipped: bool = False) -> str:
             issues.append(f"{len(result.orphaned_encodes)} orphaned files")
         lines.append(f"STATUS: Issues found - {', '.join(issues)}")
     lines.append("=" * 80)
-    
-    return "\n".join(lines)
+    lines.append("")
+
+    out.write("\n".join(lines))
+
+
+class _VideoFileEncoder(json.JSONEncoder):
+    """JSON encoder that serializes VideoFile objects in place.
+
+    Lets json.dump walk the result lists directly instead of first
+    materializing a parallel list of dicts per section.
+    """
+
+    def default(self, o):
+        if isinstance(o, VideoFile):
+            return {
+                "path": o.relative_path,
+                "size_bytes": o.size,
+                "size_human": o.size_human,
+            }
+        return super().default(o)
 
 
-def format_json(result: ComparisonResult, show_skipped: bool = False) -> str:
-    """Format comparison results as JSON."""
+def format_json(result: ComparisonResult, out: TextIO, show_skipped: bool = False) -> None:
+    """Write comparison results as JSON to ``out``."""
     data = {
         "source_folder": str(result.source_folder),
         "dest_folder": str(result.dest_folder),
@@ -348,59 +479,36 @@ def format_json(result: ComparisonResult, show_skipped: bool = False) -> str:
             "total_missing_size_bytes": result.total_missing_size,
             "total_orphaned_size_bytes": result.total_orphaned_size,
         },
-        "missing_encodes": [
-            {
-                "path": vf.relative_path,
-                "size_bytes": vf.size,
-                "size_human": vf.size_human
-            }
-            for vf in sorted(result.missing_encodes, key=lambda x: x.relative_path)
-        ],
-        "orphaned_encodes": [
-            {
-                "path": vf.relative_path,
-                "size_bytes": vf.size,
-                "size_human": vf.size_human
-            }
-            for vf in sorted(result.orphaned_encodes, key=lambda x: x.relative_path)
-        ],
+        "missing_encodes": result.missing_encodes,
+        "orphaned_encodes": result.orphaned_encodes,
     }
-    
+
     if show_skipped:
-        data["skipped_low_quality"] = [
-            {
-                "path": vf.relative_path,
-                "size_bytes": vf.size,
-                "size_human": vf.size_human
-            }
-            for vf in sorted(result.skipped_low_quality, key=lambda x: x.relative_path)
-        ]
-    
-    return json.dumps(data, indent=2, ensure_ascii=False)
+        data["skipped_low_quality"] = result.skipped_low_quality
+
+    json.dump(data, out, indent=2, ensure_ascii=False, cls=_VideoFileEncoder)
+    out.write("\n")
 
 
-def format_csv(result: ComparisonResult, show_skipped: bool = False) -> str:
-    """Format comparison results as CSV."""
-    output = io.StringIO()
-    writer = csv.writer(output)
+def format_csv(result: ComparisonResult, out: TextIO, show_skipped: bool = False) -> None:
+    """Write comparison results as CSV to ``out``."""
+    writer = csv.writer(out)
     
     # Header
     writer.writerow(["type", "path", "size_bytes", "size_human"])
     
     # Missing encodes
-    for vf in sorted(result.missing_encodes, key=lambda x: x.relative_path):
+    for vf in result.missing_encodes:
         writer.writerow(["missing_encode", vf.relative_path, vf.size, vf.size_human])
     
     # Orphaned encodes
-    for vf in sorted(result.orphaned_encodes, key=lambda x: x.relative_path):
+    for vf in result.orphaned_encodes:
         writer.writerow(["orphaned_encode", vf.relative_path, vf.size, vf.size_human])
     
     # Skipped (optional)
     if show_skipped:
-        for vf in sorted(result.skipped_low_quality, key=lambda x: x.relative_path):
+        for vf in result.skipped_low_quality:
             writer.writerow(["skipped_low_quality", vf.relative_path, vf.size, vf.size_human])
-    
-    return output.getvalue()
 
 
 def _human_size(num: int) -> str:
@@ -512,15 +620,13 @@ def main() -> int:
     # Run comparison
     result = compare_folders(source_folder, dest_folder, ignore_patterns)
     
-    # Format and output results
+    # Format and output results, streaming straight to stdout
     if args.format == "json":
-        output = format_json(result, args.show_skipped)
+        format_json(result, sys.stdout, args.show_skipped)
     elif args.format == "csv":
-        output = format_csv(result, args.show_skipped)
+        format_csv(result, sys.stdout, args.show_skipped)
     else:
-        output = format_text(result, args.show_skipped)
-    
-    print(output)
+        format_text(result, sys.stdout, args.show_skipped)
     
     # Return non-zero if there are issues
     if result.missing_encodes or result.orphaned_encodes: